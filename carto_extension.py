@@ -3,19 +3,31 @@ from google.cloud import bigquery
 from sys import argv
 from textwrap import dedent, indent
 from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 import base64
 from shapely import wkt
 import hashlib
+import importlib.util
 import json
+import math
 import os
+import pandas
+import queue
+import random
 import re
 import snowflake.connector
+import threading
+import time
 import zipfile
 
 WORKFLOWS_TEMP_SCHEMA = "WORKFLOWS_TEMP"
 EXTENSIONS_TABLENAME = "WORKFLOWS_EXTENSIONS"
 WORKFLOWS_TEMP_PLACEHOLDER = "@@workflows_temp@@"
+PYTHON_HANDLER_PLACEHOLDER = "@@python_handler@@"
+TEST_LEDGER_FILENAME = ".test_ledger.json"
+LOCAL_ENGINE_SLOTS = 4
+LOCAL_ENGINE_LATENCY = 0.05
 
 load_dotenv()
 
@@ -26,27 +38,35 @@ sf_client_instance = None
 bq_client_instance = None
 
 
+def _bq_connect():
+    try:
+        return bigquery.Client(project=os.getenv("BQ_TEST_PROJECT"))
+    except Exception as e:
+        raise Exception(f"Error connecting to BigQuery: {e}")
+
+
 def bq_client():
     global bq_client_instance
     if bq_client_instance is None:
-        try:
-            bq_client_instance = bigquery.Client(project=os.getenv("BQ_TEST_PROJECT"))
-        except Exception as e:
-            raise Exception(f"Error connecting to BigQuery: {e}")
+        bq_client_instance = _bq_connect()
     return bq_client_instance
 
 
+def _sf_connect():
+    try:
+        return snowflake.connector.connect(
+            user=os.getenv("SF_USER"),
+            password=os.getenv("SF_PASSWORD"),
+            account=os.getenv("SF_ACCOUNT"),
+        )
+    except Exception as e:
+        raise Exception(f"Error connecting to SnowFlake: {e}")
+
+
 def sf_client():
     global sf_client_instance
     if sf_client_instance is None:
-        try:
-            sf_client_instance = snowflake.connector.connect(
-                user=os.getenv("SF_USER"),
-                password=os.getenv("SF_PASSWORD"),
-                account=os.getenv("SF_ACCOUNT"),
-            )
-        except Exception as e:
-            raise Exception(f"Error connecting to SnowFlake: {e}")
+        sf_client_instance = _sf_connect()
     return sf_client_instance
 
 
@@ -97,6 +117,24 @@ def create_metadata():
             int(hashlib.sha256(fullrun_code.encode("utf-8")).hexdigest(), 16) % 10**8
         )
         component_metadata["procedureName"] = f"__proc_{component}_{code_hash}"
+        if "python" in component_metadata:
+            handler_file = os.path.join(
+                components_folder, component, "src", "handler.py"
+            )
+            with open(handler_file, "r") as f:
+                handler_code = f.read()
+            handler_hash = (
+                int(hashlib.sha256(handler_code.encode("utf-8")).hexdigest(), 16)
+                % 10**8
+            )
+            function_name = f"__func_{component}_{handler_hash}"
+            argument_types = [
+                a["type"] for a in component_metadata["python"].get("arguments", [])
+            ]
+            component_metadata["functionName"] = function_name
+            component_metadata[
+                "functionSignature"
+            ] = f"{function_name}({','.join(argument_types)})"
         icon_filename = component_metadata.get("icon")
         if icon_filename:
             icon_full_path = os.path.join(icon_folder, icon_filename)
@@ -106,7 +144,82 @@ def create_metadata():
     return metadata
 
 
+def _get_column_reference(component, ref, provider):
+    # columns given as Column inputs are read from the procedure variable
+    column_params = [p["name"] for p in component["inputs"] if p["type"] == "Column"]
+    if ref not in column_params:
+        return ref
+    variable_prefix = ":" if provider == "snowflake" else ""
+    return f"' || {variable_prefix}{ref} || '"
+
+
+def _get_output_layout_clause(component, output, provider):
+    def column(ref):
+        return _get_column_reference(component, ref, provider)
+
+    layout = component.get("outputLayout", {}).get(output["name"], {})
+    clause = ""
+    partition_by = layout.get("partitionBy")
+    if partition_by:
+        if "interval" in partition_by:
+            clause += (
+                f" PARTITION BY RANGE_BUCKET({column(partition_by['column'])}, "
+                f"GENERATE_ARRAY({partition_by['start']}, {partition_by['end']}, {partition_by['interval']}))"
+            )
+        else:
+            clause += f" PARTITION BY {column(partition_by['column'])}"
+    if layout.get("clusterBy"):
+        cluster_by = ", ".join(column(c) for c in layout["clusterBy"])
+        if provider == "snowflake":
+            clause += f" CLUSTER BY ({cluster_by})"
+        else:
+            clause += f" CLUSTER BY {cluster_by}"
+    # a string expression, so it can be concatenated in the CREATE TABLE statement
+    return f"'{clause} '" if clause else "''"
+
+
+def _replace_output_layout_placeholders(code, component, provider):
+    for output in component["outputs"]:
+        code = code.replace(
+            f"@@{output['name']}_layout@@",
+            _get_output_layout_clause(component, output, provider),
+        )
+    return code
+
+
+def _get_search_optimization_code_sf(component):
+    def column(ref):
+        return _get_column_reference(component, ref, "snowflake")
+
+    search_optimization_code = []
+    for output in component["outputs"]:
+        layout = component.get("outputLayout", {}).get(output["name"], {})
+        search_optimization = layout.get("searchOptimization")
+        if not search_optimization:
+            continue
+        methods = [
+            f"EQUALITY({column(c)})" for c in search_optimization.get("equality", [])
+        ] + [f"GEO({column(c)})" for c in search_optimization.get("geo", [])]
+        # search optimization requires Enterprise Edition, so it must not fail the component
+        search_optimization_code.append(
+            dedent(
+                f"""\
+                BEGIN
+                    EXECUTE IMMEDIATE 'ALTER TABLE ' || :{output['name']} || ' ADD SEARCH OPTIMIZATION ON {', '.join(methods)}';
+                EXCEPTION
+                    WHEN OTHER THEN
+                        NULL;
+                END;"""
+            )
+        )
+    return "\n".join(search_optimization_code)
+
+
 def get_procedure_code_bq(component):
+    if "python" in component:
+        raise ValueError(
+            f"Component '{component['name']}' uses a Python handler, which is only supported in Snowflake"
+        )
     current_folder = os.path.dirname(os.path.abspath(__file__))
     components_folder = os.path.join(current_folder, "components")
     fullrun_file = os.path.join(
@@ -114,11 +227,17 @@ def get_procedure_code_bq(component):
     )
     with open(fullrun_file, "r") as f:
         fullrun_code = f.read().replace("\n", "\n" + " " * 16)
+    fullrun_code = _replace_output_layout_placeholders(
+        fullrun_code, component, "bigquery"
+    )
     dryrun_file = os.path.join(
         components_folder, component["name"], "src", "dryrun.sql"
     )
     with open(dryrun_file, "r") as f:
         dryrun_code = f.read().replace("\n", "\n" + " " * 16)
+    dryrun_code = _replace_output_layout_placeholders(
+        dryrun_code, component, "bigquery"
+    )
 
     newline_and_tab = ",\n" + " " * 12
     params_string = newline_and_tab.join(
@@ -213,6 +332,37 @@ def create_sql_code_bq(metadata):
     return dedent(code)
 
 
+def get_function_code_sf(component):
+    current_folder = os.path.dirname(os.path.abspath(__file__))
+    handler_file = os.path.join(
+        current_folder, "components", component["name"], "src", "handler.py"
+    )
+    with open(handler_file, "r") as f:
+        handler_code = f.read()
+    python = component["python"]
+    arguments_string = ", ".join(
+        [f"{a['name']} {a['type']}" for a in python.get("arguments", [])]
+    )
+    returns_string = ", ".join([f"{r['name']} {r['type']}" for r in python["returns"]])
+    # vectorized handlers receive pandas DataFrames, so pandas is always needed
+    packages = ["pandas"] + [p for p in python.get("packages", []) if p != "pandas"]
+    packages_string = ", ".join([f"'{p}'" for p in packages])
+    # the handler is appended verbatim, since its indentation is significant
+    function_code = dedent(
+        f"""\
+        CREATE OR REPLACE FUNCTION {WORKFLOWS_TEMP_PLACEHOLDER}.{component["functionName"]}({arguments_string})
+        RETURNS TABLE ({returns_string})
+        LANGUAGE PYTHON
+        RUNTIME_VERSION = '{python.get("runtimeVersion", "3.11")}'
+        PACKAGES = ({packages_string})
+        HANDLER = '{python["handler"]}'
+        AS
+        $$
+        """
+    )
+    return function_code + handler_code.rstrip("\n") + "\n$$;"
+
+
 def get_procedure_code_sf(component):
     current_folder = os.path.dirname(os.path.abspath(__file__))
     components_folder = os.path.join(current_folder, "components")
@@ -221,11 +371,20 @@ def get_procedure_code_sf(component):
     )
     with open(fullrun_file, "r") as f:
         fullrun_code = f.read().replace("\n", "\n" + " " * 16)
+    fullrun_code = _replace_output_layout_placeholders(
+        fullrun_code, component, "snowflake"
+    )
     dryrun_file = os.path.join(
         components_folder, component["name"], "src", "dryrun.sql"
     )
     with open(dryrun_file, "r") as f:
         dryrun_code = f.read().replace("\n", "\n" + " " * 16)
+    dryrun_code = _replace_output_layout_placeholders(
+        dryrun_code, component, "snowflake"
+    )
+    search_optimization_code = _get_search_optimization_code_sf(component).replace(
+        "\n", "\n" + " " * 16
+    )
 
     newline_and_tab = ",\n" + " " * 12
     params_string = newline_and_tab.join(
@@ -262,6 +421,7 @@ def get_procedure_code_sf(component):
             ELSE
                 BEGIN
                 {fullrun_code}
+                {search_optimization_code}
                 END;
             END IF;
         END;
@@ -272,6 +432,12 @@ def get_procedure_code_sf(component):
     procedure_code = "\n".join(
         [line for line in procedure_code.split("\n") if line.strip()]
     )
+    if "python" in component:
+        procedure_code = procedure_code.replace(
+            PYTHON_HANDLER_PLACEHOLDER,
+            f"{WORKFLOWS_TEMP_PLACEHOLDER}.{component['functionName']}",
+        )
+        procedure_code = get_function_code_sf(component) + "\n" + procedure_code
     return procedure_code
 
 
@@ -288,6 +454,7 @@ def create_sql_code_sf(metadata):
     code = dedent(
         f"""DECLARE
             procedures STRING;
+            functions STRING;
         BEGIN
             CREATE TABLE IF NOT EXISTS {WORKFLOWS_TEMP_PLACEHOLDER}.{EXTENSIONS_TABLENAME} (
                 name STRING,
@@ -311,6 +478,23 @@ def create_sql_code_sf(metadata):
                     NULL;
             END;
 
+            -- remove Python handler functions from previous installations
+
+            functions := (
+                SELECT LISTAGG(c.value:functionSignature::STRING, ';')
+                FROM {WORKFLOWS_TEMP_PLACEHOLDER}.{EXTENSIONS_TABLENAME},
+                    LATERAL FLATTEN(input => PARSE_JSON(metadata):components) c
+                WHERE name = '{metadata["name"]}'
+            );
+
+            BEGIN
+                EXECUTE IMMEDIATE 'DROP FUNCTION IF EXISTS {WORKFLOWS_TEMP_PLACEHOLDER}.'
+                    || REPLACE(:functions, ';', ';DROP FUNCTION IF EXISTS {WORKFLOWS_TEMP_PLACEHOLDER}.');
+            EXCEPTION
+                WHEN OTHER THEN
+                    NULL;
+            END;
+
             DELETE FROM {WORKFLOWS_TEMP_PLACEHOLDER}.{EXTENSIONS_TABLENAME}
             WHERE name = '{metadata["name"]}';
 
@@ -461,64 +645,142 @@ def _upload_test_table_sf(filename, component):
     cursor.close()
 
 
-def _get_test_results(metadata, component):
+def _load_test_ledger():
+    current_folder = os.path.dirname(os.path.abspath(__file__))
+    ledger_file = os.path.join(current_folder, TEST_LEDGER_FILENAME)
+    if not os.path.exists(ledger_file):
+        return {}
+    with open(ledger_file, "r") as f:
+        return json.load(f)
+
+
+def _save_test_ledger(ledger):
+    current_folder = os.path.dirname(os.path.abspath(__file__))
+    ledger_file = os.path.join(current_folder, TEST_LEDGER_FILENAME)
+    with open(ledger_file, "w") as f:
+        f.write(json.dumps(ledger, indent=2, sort_keys=True))
+
+
+def _get_test_key(metadata, component, test_configuration):
+    current_folder = os.path.dirname(os.path.abspath(__file__))
+    component_folder = os.path.join(current_folder, "components", component["name"])
+    test_folder = os.path.join(component_folder, "test")
+    # hash the code that gets deployed, so changes in the builder invalidate the ledger too
+    if metadata["provider"] == "bigquery":
+        deployed_code = get_procedure_code_bq(component)
+        environment = [os.getenv("BQ_TEST_PROJECT"), os.getenv("BQ_TEST_DATASET")]
+    else:
+        deployed_code = get_procedure_code_sf(component)
+        environment = [
+            os.getenv("SF_ACCOUNT"),
+            os.getenv("SF_TEST_DATABASE"),
+            os.getenv("SF_TEST_SCHEMA"),
+        ]
+    input_files = []
+    for inputparam in component["inputs"]:
+        param_value = test_configuration["inputs"][inputparam["name"]]
+        if inputparam["type"] == "Table" and param_value is not None:
+            input_files.append(os.path.join(test_folder, f"{param_value}.ndjson"))
+            input_files.append(os.path.join(test_folder, f"{param_value}.schema"))
+    input_files.append(
+        os.path.join(test_folder, "fixtures", f"{test_configuration['id']}.json")
+    )
+    key = hashlib.sha256()
+    key.update(metadata["provider"].encode("utf-8"))
+    key.update(json.dumps(environment).encode("utf-8"))
+    key.update(deployed_code.encode("utf-8"))
+    key.update(json.dumps(test_configuration, sort_keys=True).encode("utf-8"))
+    for filename in input_files:
+        if os.path.exists(filename):
+            key.update(os.path.relpath(filename, component_folder).encode("utf-8"))
+            with open(filename, "rb") as f:
+                key.update(f.read())
+    return key.hexdigest()
+
+
+def _get_test_configurations(component):
+    current_folder = os.path.dirname(os.path.abspath(__file__))
+    test_configuration_file = os.path.join(
+        current_folder, "components", component["name"], "test", "test.json"
+    )
+    with open(test_configuration_file, "r") as f:
+        return json.load(f)
+
+
+def _upload_test_tables(metadata, component):
     if metadata["provider"] == "bigquery":
         upload_function = _upload_test_table_bq
-        workflows_temp = bq_workflows_temp
     else:
         upload_function = _upload_test_table_sf
+    current_folder = os.path.dirname(os.path.abspath(__file__))
+    test_folder = os.path.join(current_folder, "components", component["name"], "test")
+    for filename in os.listdir(test_folder):
+        if filename.endswith(".ndjson"):
+            upload_function(os.path.join(test_folder, filename), component)
+
+
+def _get_call_query(component, test_configuration, workflows_temp):
+    param_values = []
+    tables = {}
+    for inputparam in component["inputs"]:
+        param_value = test_configuration["inputs"][inputparam["name"]]
+        if param_value is None:
+            param_values.append(None)
+        else:
+            if inputparam["type"] == "Table":
+                tablename = f"'{workflows_temp}._test_{component['name']}_{param_value}'"
+                param_values.append(tablename)
+            elif inputparam["type"] in [
+                "String",
+                "Selection",
+                "StringSql",
+                "Json",
+                "GeoJson",
+                "Column",
+            ]:
+                param_values.append(f"'{param_value}'")
+            else:
+                param_values.append(param_value)
+    for outputparam in component["outputs"]:
+        tablename = f"{workflows_temp}._table_{uuid4().hex}"
+        param_values.append(f"'{tablename}'")
+        tables[outputparam["name"]] = tablename
+    param_values.append(False)  # dry run
+    query = f"""CALL {workflows_temp}.{component['procedureName']}(
+        {','.join([str(p) if p is not None else 'null' for p in param_values])}, '{{ }}'
+    );"""
+    return query, tables
+
+
+def _get_test_results(metadata, component, pending=None):
+    if metadata["provider"] == "bigquery":
+        workflows_temp = bq_workflows_temp
+    else:
         workflows_temp = sf_workflows_temp
     results = {}
     if component:
         components = [c for c in metadata["components"] if c["name"] == component]
     else:
         components = metadata["components"]
+    if pending is not None:
+        components = [c for c in components if c["name"] in pending]
     current_folder = os.path.dirname(os.path.abspath(__file__))
     components_folder = os.path.join(current_folder, "components")
     for component in components:
         component_folder = os.path.join(components_folder, component["name"])
-        test_folder = os.path.join(component_folder, "test")
         # upload test tables
-        for filename in os.listdir(test_folder):
-            if filename.endswith(".ndjson"):
-                upload_function(os.path.join(test_folder, filename), component)
+        _upload_test_tables(metadata, component)
         # run tests
-        test_configuration_file = os.path.join(test_folder, "test.json")
-        with open(test_configuration_file, "r") as f:
-            test_configurations = json.load(f)
-        tables = {}
+        test_configurations = _get_test_configurations(component)
         component_results = {}
         for test_configuration in test_configurations:
-            param_values = []
             test_id = test_configuration["id"]
+            if pending is not None and test_id not in pending[component["name"]]:
+                continue
             component_results[test_id] = {}
-            for inputparam in component["inputs"]:
-                param_value = test_configuration["inputs"][inputparam["name"]]
-                if param_value is None:
-                    param_values.append(None)
-                else:
-                    if inputparam["type"] == "Table":
-                        tablename = f"'{workflows_temp}._test_{component['name']}_{param_value}'"
-                        param_values.append(tablename)
-                    elif inputparam["type"] in [
-                        "String",
-                        "Selection",
-                        "StringSql",
-                        "Json",
-                        "GeoJson",
-                        "Column",
-                    ]:
-                        param_values.append(f"'{param_value}'")
-                    else:
-                        param_values.append(param_value)
-            for outputparam in component["outputs"]:
-                tablename = f"{workflows_temp}._table_{uuid4().hex}"
-                param_values.append(f"'{tablename}'")
-                tables[outputparam["name"]] = tablename
-            param_values.append(False)  # dry run
-            query = f"""CALL {workflows_temp}.{component['procedureName']}(
-                {','.join([str(p) if p is not None else 'null' for p in param_values])}, '{{ }}'
-            );"""
+            query, tables = _get_call_query(
+                component, test_configuration, workflows_temp
+            )
             if verbose:
                 print(query)
             if metadata["provider"] == "bigquery":
@@ -544,25 +806,57 @@ def _get_test_results(metadata, component):
     return results
 
 
-def test(component):
+def test(component, force):
     print("Testing extension...")
     metadata = create_metadata()
     current_folder = os.path.dirname(os.path.abspath(__file__))
     components_folder = os.path.join(current_folder, "components")
+    ledger = _load_test_ledger()
+    if component:
+        components = [c for c in metadata["components"] if c["name"] == component]
+        if not components:
+            raise ValueError(f"Component '{component}' not found in extension")
+    else:
+        components = metadata["components"]
+    # skip tests whose inputs are unchanged since their last green run
+    pending = {}
+    keys = {}
+    for component in components:
+        passed = ledger.get(component["name"], {})
+        for test_configuration in _get_test_configurations(component):
+            test_id = test_configuration["id"]
+            key = _get_test_key(metadata, component, test_configuration)
+            keys[(component["name"], test_id)] = key
+            if not force and passed.get(str(test_id)) == key:
+                if verbose:
+                    print(
+                        f"Skipping test '{test_id}' for component {component['name']}: unchanged since last pass."
+                    )
+                continue
+            pending.setdefault(component["name"], []).append(test_id)
+    if not pending:
+        print("Extension correctly tested. All tests unchanged since last pass.")
+        return
     deploy(None)
-    results = _get_test_results(metadata, component)
-    for component in metadata["components"]:
-        component_folder = os.path.join(components_folder, component["name"])
-        for test_id, outputs in results[component["name"]].items():
-            test_folder = os.path.join(component_folder, "test", "fixtures")
-            test_filename = os.path.join(test_folder, f"{test_id}.json")
-            with open(test_filename, "r") as f:
-                expected = json.load(f)
-                for output_name, output in outputs.items():
-                    output = json.loads(json.dumps(output))
-                    assert sorted(expected[output_name], key=json.dumps) == sorted(
-                        output, key=json.dumps
-                    ), f"Test '{test_id}' failed for component {component['name']} and table {output_name}."
+    results = _get_test_results(metadata, None, pending)
+    try:
+        for component_name, component_results in results.items():
+            component_folder = os.path.join(components_folder, component_name)
+            for test_id, outputs in component_results.items():
+                test_folder = os.path.join(component_folder, "test", "fixtures")
+                test_filename = os.path.join(test_folder, f"{test_id}.json")
+                with open(test_filename, "r") as f:
+                    expected = json.load(f)
+                    for output_name, output in outputs.items():
+                        output = json.loads(json.dumps(output))
+                        assert sorted(expected[output_name], key=json.dumps) == sorted(
+                            output, key=json.dumps
+                        ), f"Test '{test_id}' failed for component {component_name} and table {output_name}."
+                ledger.setdefault(component_name, {})[str(test_id)] = keys[
+                    (component_name, test_id)
+                ]
+    finally:
+        _save_test_ledger(ledger)
     print("Extension correctly tested.")
 
 
@@ -571,19 +865,341 @@ def capture(component):
     metadata = create_metadata()
     current_folder = os.path.dirname(os.path.abspath(__file__))
     components_folder = os.path.join(current_folder, "components")
+    ledger = _load_test_ledger()
     deploy(None)
     results = _get_test_results(metadata, component)
     for component in metadata["components"]:
+        if component["name"] not in results:
+            continue
         component_folder = os.path.join(components_folder, component["name"])
+        test_configurations = {
+            c["id"]: c for c in _get_test_configurations(component)
+        }
         for test_id, outputs in results[component["name"]].items():
             test_folder = os.path.join(component_folder, "test", "fixtures")
             os.makedirs(test_folder, exist_ok=True)
             test_filename = os.path.join(test_folder, f"{test_id}.json")
             with open(test_filename, "w") as f:
                 f.write(json.dumps(outputs, indent=2))
+            # captured outputs are the fixture, so a later `test` can reuse them
+            ledger.setdefault(component["name"], {})[str(test_id)] = _get_test_key(
+                metadata, component, test_configurations[test_id]
+            )
+    _save_test_ledger(ledger)
     print("Fixtures correctly captured.")
 
 
+# in-process stand-in for a data warehouse, used to check the `stress` setup offline.
+# It doesn't run any SQL: it sleeps a random time behind LOCAL_ENGINE_SLOTS slots, and
+# statements touching the extensions table (redeploys) block any CALL issued meanwhile
+class _LocalEngine:
+    def __init__(self):
+        self._slots = threading.BoundedSemaphore(LOCAL_ENGINE_SLOTS)
+        self._extensions_lock = threading.Lock()
+
+    def cursor(self):
+        return self
+
+    def close(self):
+        pass
+
+    def execute(self, query):
+        if EXTENSIONS_TABLENAME in query:
+            with self._extensions_lock, self._slots:
+                time.sleep(LOCAL_ENGINE_LATENCY * 10)
+        else:
+            with self._extensions_lock:
+                pass
+            with self._slots:
+                time.sleep(random.expovariate(1 / LOCAL_ENGINE_LATENCY))
+
+
+def _execute(connection, query):
+    if isinstance(connection, bigquery.Client):
+        connection.query(query).result()
+    else:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query)
+        finally:
+            cursor.close()
+
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    index = max(0, math.ceil(percentile / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def stress(component, concurrency, duration, redeploy_interval, local):
+    print("Stress testing extension...")
+    metadata = create_metadata()
+    if component:
+        components = [c for c in metadata["components"] if c["name"] == component]
+    else:
+        components = metadata["components"][:1]
+    if not components:
+        raise ValueError(f"Component '{component}' not found in extension")
+    component = components[0]
+    test_configurations = _get_test_configurations(component)
+    if metadata["provider"] == "bigquery":
+        workflows_temp = bq_workflows_temp
+        deploy_code = create_sql_code_bq(metadata)
+    else:
+        workflows_temp = sf_workflows_temp
+        deploy_code = create_sql_code_sf(metadata)
+    deploy_code = deploy_code.replace(WORKFLOWS_TEMP_PLACEHOLDER, workflows_temp)
+
+    latencies = []
+    redeploy_latencies = []
+    errors = []
+    redeploy_errors = []
+    output_tables = []
+    lock = threading.Lock()
+
+    # connection pool, one connection per concurrent invocation plus one for redeploys
+    pool = queue.Queue()
+    connections = []
+    try:
+        if local:
+            engine = _LocalEngine()
+            connections = [engine] * (concurrency + 1)
+        else:
+            deploy(None)
+            _upload_test_tables(metadata, component)
+            connect = _bq_connect if metadata["provider"] == "bigquery" else _sf_connect
+            for _ in range(concurrency + 1):
+                connections.append(connect())
+        for connection in connections:
+            pool.put(connection)
+
+        deadline = time.monotonic() + duration
+
+        def run_call(worker):
+            i = worker
+            while time.monotonic() < deadline:
+                test_configuration = test_configurations[i % len(test_configurations)]
+                i += concurrency
+                query, tables = _get_call_query(
+                    component, test_configuration, workflows_temp
+                )
+                connection = pool.get()
+                start = time.monotonic()
+                try:
+                    _execute(connection, query)
+                    with lock:
+                        latencies.append(time.monotonic() - start)
+                except Exception as e:
+                    with lock:
+                        errors.append(str(e))
+                finally:
+                    pool.put(connection)
+                    with lock:
+                        output_tables.extend(tables.values())
+
+        def run_redeploy():
+            while time.monotonic() + redeploy_interval < deadline:
+                time.sleep(redeploy_interval)
+                connection = pool.get()
+                start = time.monotonic()
+                try:
+                    _execute(connection, deploy_code)
+                    with lock:
+                        redeploy_latencies.append(time.monotonic() - start)
+                except Exception as e:
+                    with lock:
+                        redeploy_errors.append(str(e))
+                finally:
+                    pool.put(connection)
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency + 1) as executor:
+            futures = [
+                executor.submit(run_call, worker) for worker in range(concurrency)
+            ]
+            if redeploy_interval:
+                futures.append(executor.submit(run_redeploy))
+            for future in futures:
+                future.result()
+        elapsed = time.monotonic() - start
+
+        def drop_table(tablename):
+            connection = pool.get()
+            try:
+                _execute(connection, f"DROP TABLE IF EXISTS {tablename}")
+            except Exception as e:
+                pass
+            finally:
+                pool.put(connection)
+
+        if not local:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(drop_table, output_tables))
+    finally:
+        if not local:
+            for connection in connections:
+                connection.close()
+
+    if local:
+        print(
+            "Running against the local stand-in engine: latencies are synthetic "
+            "and don't reflect the component's performance."
+        )
+    print(f"Component: {component['name']}")
+    print(f"Concurrency: {concurrency}, duration: {elapsed:.1f}s")
+    print(f"Calls: {len(latencies)} succeeded, {len(errors)} failed")
+    print(f"Throughput: {len(latencies) / elapsed:.2f} calls/s")
+    if latencies:
+        print(
+            "Latency: "
+            + ", ".join(
+                f"p{p} {_percentile(latencies, p):.3f}s" for p in [50, 95, 99]
+            )
+            + f", max {max(latencies):.3f}s"
+            + (" (synthetic)" if local else "")
+        )
+    if redeploy_interval:
+        redeploys = f"Redeploys: {len(redeploy_latencies)} succeeded, {len(redeploy_errors)} failed"
+        if redeploy_latencies:
+            redeploys += f", max {max(redeploy_latencies):.3f}s"
+        print(redeploys)
+    if verbose:
+        for error in errors:
+            print(error)
+        for error in redeploy_errors:
+            print(f"Redeploy: {error}")
+    print("Extension correctly stress tested.")
+
+
+def _load_component_metadata(component):
+    current_folder = os.path.dirname(os.path.abspath(__file__))
+    metadata_file = os.path.join(
+        current_folder, "components", component, "metadata.json"
+    )
+    if not os.path.exists(metadata_file):
+        raise ValueError(f"Component '{component}' not found")
+    with open(metadata_file, "r") as f:
+        return json.load(f)
+
+
+def _load_handler_class(component):
+    current_folder = os.path.dirname(os.path.abspath(__file__))
+    handler_file = os.path.join(
+        current_folder, "components", component["name"], "src", "handler.py"
+    )
+    spec = importlib.util.spec_from_file_location(
+        f"{component['name']}_handler", handler_file
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, component["python"]["handler"])
+
+
+def _handler_result_to_dataframe(result):
+    if isinstance(result, pandas.DataFrame):
+        return result
+    # vectorized handlers may return a tuple of Series, one per column
+    if isinstance(result, (tuple, list)) and all(
+        isinstance(r, pandas.Series) for r in result
+    ):
+        return pandas.concat(
+            [r.reset_index(drop=True) for r in result], axis=1, ignore_index=True
+        )
+    return pandas.DataFrame(list(result))
+
+
+def _run_handler_partition(handler_class, batch):
+    # a new handler instance per partition, like Snowflake does
+    handler = handler_class()
+    results = []
+    if hasattr(handler, "process"):
+        if hasattr(handler.process, "_sf_vectorized_input"):
+            batch_size = (
+                getattr(handler.process, "_sf_max_batch_size", None) or len(batch)
+            )
+            for i in range(0, len(batch), max(batch_size, 1)):
+                result = handler.process(batch.iloc[i : i + batch_size])
+                if result is not None:
+                    results.append(_handler_result_to_dataframe(result))
+        else:
+            # non-vectorized handlers get the values of one row as arguments
+            for row in batch.itertuples(index=False):
+                result = handler.process(*row)
+                if result is not None:
+                    results.append(_handler_result_to_dataframe(result))
+    if hasattr(handler, "end_partition"):
+        if hasattr(handler.end_partition, "_sf_vectorized_input"):
+            result = handler.end_partition(batch)
+        else:
+            result = handler.end_partition()
+        if result is not None:
+            results.append(_handler_result_to_dataframe(result))
+    return [r for r in results if len(r)]
+
+
+def run_handler(component):
+    print("Running Python handler locally...")
+    component_metadata = _load_component_metadata(component)
+    if "python" not in component_metadata:
+        raise ValueError(f"Component '{component}' has no Python handler")
+    returns = [r["name"] for r in component_metadata["python"]["returns"]]
+    handler_class = _load_handler_class(component_metadata)
+    current_folder = os.path.dirname(os.path.abspath(__file__))
+    test_folder = os.path.join(current_folder, "components", component, "test")
+    for test_configuration in _get_test_configurations(component_metadata):
+        test_id = test_configuration["id"]
+        handler_configuration = test_configuration.get("handler")
+        if handler_configuration is None:
+            continue
+        data = pandas.read_json(
+            os.path.join(test_folder, f"{handler_configuration['input']}.ndjson"),
+            lines=True,
+        )
+        partition_by = handler_configuration.get("partitionBy", [])
+        if partition_by:
+            partitions = [group for _, group in data.groupby(partition_by, sort=False)]
+        else:
+            partitions = [data]
+        start = time.perf_counter()
+        results = []
+        for partition in partitions:
+            # handlers receive the arguments of the function as positional columns
+            batch = partition[handler_configuration["arguments"]].reset_index(drop=True)
+            batch.columns = range(len(batch.columns))
+            results.extend(_run_handler_partition(handler_class, batch))
+        elapsed = time.perf_counter() - start
+        for result in results:
+            assert len(result.columns) == len(
+                returns
+            ), f"Test '{test_id}' failed for component {component}: handler returned {len(result.columns)} columns, expected {len(returns)}."
+        if results:
+            output = pandas.concat(results, ignore_index=True)
+            output.columns = returns
+        else:
+            output = pandas.DataFrame(columns=returns)
+        print(
+            f"Test '{test_id}': {len(data)} rows in {len(partitions)} partitions, "
+            f"{len(output)} rows returned in {elapsed:.3f}s"
+        )
+        if verbose:
+            print(output.to_string())
+        # compare with the expected rows, or with the fixture of the procedure output
+        if "expected" in handler_configuration:
+            expected = handler_configuration["expected"]
+        else:
+            output_name = handler_configuration.get(
+                "output", component_metadata["outputs"][0]["name"]
+            )
+            fixture_file = os.path.join(test_folder, "fixtures", f"{test_id}.json")
+            with open(fixture_file, "r") as f:
+                expected = json.load(f)[output_name]
+        rows = json.loads(output.to_json(orient="values"))
+        assert sorted(expected, key=json.dumps) == sorted(
+            rows, key=json.dumps
+        ), f"Test '{test_id}' failed for component {component}: handler output doesn't match the expected rows."
+    print("Python handler correctly run.")
+
+
 def package():
     print("Packaging extension...")
     current_folder = os.path.dirname(os.path.abspath(__file__))
@@ -687,6 +1303,52 @@ def check():
             assert (
                 field in component_metadata
             ), f"Component metadata is missing field '{field}'"
+        output_names = [o["name"] for o in component_metadata.get("outputs", [])]
+        for output_name, layout in component_metadata.get("outputLayout", {}).items():
+            assert (
+                output_name in output_names
+            ), f"Output layout of component '{component['name']}' refers to unknown output '{output_name}'"
+            if metadata["provider"] == "bigquery":
+                assert (
+                    "searchOptimization" not in layout
+                ), f"Search optimization in output '{output_name}' of component '{component['name']}' is only supported in Snowflake"
+                assert (
+                    len(layout.get("clusterBy", [])) <= 4
+                ), f"Output '{output_name}' of component '{component['name']}' can be clustered by 4 columns at most"
+            else:
+                assert (
+                    "partitionBy" not in layout
+                ), f"Partitioning in output '{output_name}' of component '{component['name']}' is only supported in BigQuery"
+                if "searchOptimization" in layout:
+                    search_optimization = layout["searchOptimization"]
+                    assert search_optimization.get(
+                        "equality"
+                    ) or search_optimization.get(
+                        "geo"
+                    ), f"Search optimization in output '{output_name}' of component '{component['name']}' has no columns"
+            if "clusterBy" in layout or "partitionBy" in layout:
+                with open(os.path.join(component_folder, "src", "fullrun.sql")) as f:
+                    assert (
+                        f"@@{output_name}_layout@@" in f.read()
+                    ), f"Output '{output_name}' of component '{component['name']}' declares a layout, but '@@{output_name}_layout@@' is not used in fullrun.sql"
+        if "python" in component_metadata:
+            python = component_metadata["python"]
+            for field in ["handler", "returns"]:
+                assert (
+                    field in python
+                ), f"Component '{component['name']}' python metadata is missing field '{field}'"
+            handler_file = os.path.join(component_folder, "src", "handler.py")
+            with open(handler_file, "r") as f:
+                handler_code = f.read()
+            assert (
+                "$$" not in handler_code
+            ), f"Python handler of component '{component['name']}' cannot contain '$$'"
+            assert re.search(
+                rf"^class {python['handler']}\b", handler_code, re.MULTILINE
+            ), f"Python handler class '{python['handler']}' not found in component '{component['name']}'"
+            assert (
+                metadata["provider"] == "snowflake"
+            ), f"Component '{component['name']}' uses a Python handler, which is only supported in Snowflake"
     required_fields = [
         "name",
         "title",
@@ -711,7 +1373,16 @@ parser.add_argument(
     "action",
     nargs=1,
     type=str,
-    choices=["package", "deploy", "test", "capture", "check", "update"],
+    choices=[
+        "package",
+        "deploy",
+        "test",
+        "capture",
+        "check",
+        "update",
+        "stress",
+        "handler",
+    ],
 )
 parser.add_argument("-c", "--component", help="Choose one component", type=str)
 parser.add_argument(
@@ -722,23 +1393,78 @@ parser.add_argument(
     required="deploy" in argv,
 )
 parser.add_argument("-v", "--verbose", help="Verbose mode", action="store_true")
+parser.add_argument(
+    "-f",
+    "--force",
+    help="Run all tests, even those unchanged since their last pass",
+    action="store_true",
+)
+parser.add_argument(
+    "-n",
+    "--concurrency",
+    help="Number of simultaneous invocations in stress mode (default: 10)",
+    type=int,
+)
+parser.add_argument(
+    "--duration",
+    help="Duration of the stress run, in seconds (default: 60)",
+    type=float,
+)
+parser.add_argument(
+    "--redeploy-interval",
+    help="Redeploy the extension every given number of seconds during the stress run",
+    type=float,
+)
+parser.add_argument(
+    "--local",
+    help="Run the stress test against a local stand-in engine",
+    action="store_true",
+)
 args = parser.parse_args()
 action = args.action[0]
 verbose = args.verbose
-if args.component and action not in ["capture", "test"]:
-    parser.error("Component can only be used with 'capture' and 'test' actions")
+if args.component and action not in ["capture", "test", "stress", "handler"]:
+    parser.error(
+        "Component can only be used with 'capture', 'test', 'stress' and 'handler' actions"
+    )
+if not args.component and action in ["handler"]:
+    parser.error("Component is required for 'handler' action")
 if args.destination and action not in ["deploy"]:
     parser.error("Destination can only be used with 'deploy' action")
+if args.force and action not in ["test"]:
+    parser.error("Force can only be used with 'test' action")
+if (
+    args.concurrency is not None
+    or args.duration is not None
+    or args.redeploy_interval is not None
+    or args.local
+) and action not in ["stress"]:
+    parser.error(
+        "Concurrency, duration, redeploy interval and local can only be used with 'stress' action"
+    )
+for name in ["concurrency", "duration", "redeploy_interval"]:
+    if getattr(args, name) is not None and getattr(args, name) <= 0:
+        parser.error(f"{name.replace('_', ' ').capitalize()} must be greater than 0")
 if action == "package":
     check()
     package()
 elif action == "deploy":
     deploy(args.destination)
 elif action == "test":
-    test(args.component)
+    test(args.component, args.force)
 elif action == "capture":
     capture(args.component)
 elif action == "check":
     check()
 elif action == "update":
     update()
+elif action == "stress":
+    stress(
+        args.component,
+        args.concurrency or 10,
+        args.duration or 60,
+        args.redeploy_interval,
+        args.local,
+    )
+elif action == "handler":
+    run_handler(args.component)
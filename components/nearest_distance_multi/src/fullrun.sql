@@ -2,7 +2,7 @@
 ---------------------------------------------------------
 
 EXECUTE IMMEDIATE '
-    CREATE TABLE IF NOT EXISTS ' || :output_table || ' AS
+    CREATE TABLE IF NOT EXISTS ' || :output_table || @@output_table_layout@@ || ' AS
     WITH nearest AS (
         SELECT
             a.*,
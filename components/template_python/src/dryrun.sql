@@ -0,0 +1,9 @@
+-- This is the sample code for the Snowflake dryrun.
+---------------------------------------------------------
+
+EXECUTE IMMEDIATE '
+CREATE TABLE IF NOT EXISTS ' || :output_table || '
+AS SELECT id, name, 0 AS name_length
+FROM ' || :input_table || '
+WHERE 1 = 0;
+';
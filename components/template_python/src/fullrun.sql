@@ -0,0 +1,10 @@
+-- This is the sample code for the Snowflake fullrun.
+-- The Python handler placeholder is replaced with the function created from handler.py
+---------------------------------------------------------
+
+EXECUTE IMMEDIATE '
+CREATE TABLE IF NOT EXISTS ' || :output_table || '
+AS SELECT h.*
+FROM ' || :input_table || ' t,
+    TABLE(@@python_handler@@(t.id, t.name) OVER (PARTITION BY t.team)) h
+';
@@ -0,0 +1,12 @@
+import pandas
+
+
+class NameLength:
+    def end_partition(self, df):
+        df.columns = ["id", "name"]
+        return pandas.DataFrame(
+            {"id": df["id"], "name": df["name"], "name_length": df["name"].str.len()}
+        )
+
+    # same as the _snowflake.vectorized decorator, without depending on Snowflake
+    end_partition._sf_vectorized_input = pandas.DataFrame